@@ -2,9 +2,11 @@
 US County Population 3D Map — Streamlit App
 Displays a 3D extruded choropleth of US counties colored and extruded by population.
 """
-import json
+import gzip
 
+import orjson
 import pydeck as pdk
+import requests
 import streamlit as st
 import streamlit.components.v1 as components
 
@@ -21,16 +23,36 @@ st.caption("ACS 2024 5-Year Estimates · Total Population (B01003_001E)")
 # Load data
 # ---------------------------------------------------------------------------
 DATA_PATH = "data/us_counties_population.geojson"
-GITHUB_RAW_URL = ""  # Set to raw GitHub URL for cloud deployment
+GITHUB_RAW_URL = ""  # Set to raw GitHub URL of DATA_PATH for cloud deployment
+TILES_URL = ""  # Set to a .../{z}/{x}/{y}.pbf URL serving data/tiles to stream vector tiles
 
 
-@st.cache_data
+@st.cache_resource
 def load_geojson():
-    with open(DATA_PATH) as f:
-        return json.load(f)
+    # Shared read-only dict: cache_resource skips cache_data's pickle/copy of the whole tree
+    with gzip.open(DATA_PATH + ".gz", "rb") as f:
+        return orjson.loads(f.read())
 
 
-geojson = load_geojson()
+# Vector tiles load only what is in view; with a hosted GeoJSON URL, deck.gl
+# fetches (and the browser caches) the file itself; otherwise the parsed
+# GeoJSON is inlined into the deck HTML
+if TILES_URL:
+    layer_type, data_url = "MVTLayer", TILES_URL
+else:
+    layer_type, data_url = "GeoJsonLayer", GITHUB_RAW_URL
+geojson = None if data_url else load_geojson()
+
+
+@st.cache_data(ttl=3600)
+def load_tiles_max_zoom(tiles_url):
+    # tippecanoe writes metadata.json (with the tileset's maxzoom) at the tile root
+    resp = requests.get(tiles_url.split("{z}")[0] + "metadata.json", timeout=30)
+    resp.raise_for_status()
+    return int(orjson.loads(resp.content)["maxzoom"])
+
+
+tiles_max_zoom = load_tiles_max_zoom(TILES_URL) if TILES_URL else None
 
 # ---------------------------------------------------------------------------
 # Sidebar controls
@@ -74,37 +96,9 @@ map_style = map_styles[map_style_label]
 wireframe = st.sidebar.toggle("Wireframe", value=True)
 
 # ---------------------------------------------------------------------------
-# PyDeck layer
+# PyDeck map
 # ---------------------------------------------------------------------------
-layer = pdk.Layer(
-    "GeoJsonLayer",
-    data=geojson,
-    opacity=opacity,
-    stroked=True,
-    filled=True,
-    extruded=True,
-    wireframe=wireframe,
-    get_elevation="properties.log_pop",
-    elevation_scale=elevation_scale,
-    get_fill_color="properties.fill_color",
-    get_line_color=[255, 255, 255, 40],
-    line_width_min_pixels=0.5,
-    pickable=True,
-    auto_highlight=True,
-    highlight_color=[255, 255, 0, 100],
-)
-
-view_state = pdk.ViewState(
-    latitude=38.5,
-    longitude=-96.0,
-    zoom=3.8,
-    pitch=pitch,
-    bearing=0,
-    min_zoom=2,
-    max_zoom=15,
-)
-
-tooltip = {
+TOOLTIP = {
     "html": (
         "<div style='font-family: Arial, sans-serif; padding: 6px;'>"
         "<b style='font-size: 14px;'>{properties.county_name}</b><br/>"
@@ -123,15 +117,88 @@ tooltip = {
     },
 }
 
-deck = pdk.Deck(
-    layers=[layer],
-    initial_view_state=view_state,
-    tooltip=tooltip,
-    map_style=map_style,
-    parameters={"depthTest": True},
-)
 
-components.html(deck.to_html(as_string=True), height=700, scrolling=False)
+# Each entry holds the full deck HTML (MBs when the GeoJSON is inlined), so keep few
+@st.cache_data(show_spinner=False, max_entries=8)
+def build_deck_html(
+    layer_type,
+    data_url,
+    tiles_max_zoom,
+    _geojson,
+    elevation_scale,
+    pitch,
+    opacity,
+    map_style,
+    wireframe,
+):
+    """Render the deck to HTML, cached per layer source and control state (_geojson is not hashed)."""
+    # Past the tileset's max zoom, MVTLayer must overzoom instead of requesting missing
+    # tiles; fips identifies a county across tiles so it highlights as one shape
+    # (quoted so pydeck passes a literal string instead of an accessor expression)
+    tile_props = (
+        {"max_zoom": tiles_max_zoom, "unique_id_property": "'fips'"}
+        if layer_type == "MVTLayer"
+        else {}
+    )
+    layer = pdk.Layer(
+        layer_type,
+        data=data_url or _geojson,
+        opacity=opacity,
+        stroked=True,
+        filled=True,
+        extruded=True,
+        wireframe=wireframe,
+        get_elevation="properties.log_pop",
+        elevation_scale=elevation_scale,
+        # fill_color is packed as 0xRRGGBB; unpack channels and apply a fixed alpha
+        get_fill_color=(
+            "[(properties.fill_color >> 16) & 255, "
+            "(properties.fill_color >> 8) & 255, "
+            "properties.fill_color & 255, 200]"
+        ),
+        get_line_color=[255, 255, 255, 40],
+        line_width_min_pixels=0.5,
+        pickable=True,
+        auto_highlight=True,
+        highlight_color=[255, 255, 0, 100],
+        **tile_props,
+    )
+
+    view_state = pdk.ViewState(
+        latitude=38.5,
+        longitude=-96.0,
+        zoom=3.8,
+        pitch=pitch,
+        bearing=0,
+        min_zoom=2,
+        max_zoom=15,
+    )
+
+    deck = pdk.Deck(
+        layers=[layer],
+        initial_view_state=view_state,
+        tooltip=TOOLTIP,
+        map_style=map_style,
+        parameters={"depthTest": True},
+    )
+    return deck.to_html(as_string=True)
+
+
+components.html(
+    build_deck_html(
+        layer_type,
+        data_url,
+        tiles_max_zoom,
+        geojson,
+        elevation_scale,
+        pitch,
+        opacity,
+        map_style,
+        wireframe,
+    ),
+    height=700,
+    scrolling=False,
+)
 
 # ---------------------------------------------------------------------------
 # Footer
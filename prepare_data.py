@@ -1,46 +1,64 @@
 """
 Prepare US County Population Data for 3D Map
 Fetches county GeoJSON + ACS 2024 population data, merges, and saves locally.
-Run once: python prepare_data.py
+Run once: python prepare_data.py (Python >= 3.11, required by topojson 2.x)
 """
-import json
-import math
+import gzip
 import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
+import orjson
 import pandas as pd
-import requests
+import requests_cache
+import topojson
+from shapely.geometry import shape
 
 print("=" * 70)
 print("US County Population - Data Preparation")
 print("=" * 70)
 
-# ---------------------------------------------------------------------------
-# 1. Download US county boundary GeoJSON (simplified 20m from Census via Plotly)
-# ---------------------------------------------------------------------------
-print("\n[1/5] Downloading US county boundaries...")
 COUNTIES_URL = (
     "https://raw.githubusercontent.com/plotly/datasets/master/"
     "geojson-counties-fips.json"
 )
-resp = requests.get(COUNTIES_URL, timeout=60)
-resp.raise_for_status()
-counties_geojson = resp.json()
-print(f"       Loaded {len(counties_geojson['features']):,} county polygons")
-
-# ---------------------------------------------------------------------------
-# 2. Fetch ACS 2024 5-Year population data from Census Bureau API
-#    Table B01003_001E = Total Population
-# ---------------------------------------------------------------------------
-print("[2/5] Fetching ACS 2024 population data from Census Bureau...")
 CENSUS_URL = (
     "https://api.census.gov/data/2024/acs/acs5"
     "?get=NAME,B01003_001E"
     "&for=county:*"
     "&in=state:*"
 )
-resp = requests.get(CENSUS_URL, timeout=60)
-resp.raise_for_status()
-census_raw = resp.json()
+# Deepest vector tile level; tippecanoe records it in data/tiles/metadata.json,
+# which the app reads so deck.gl overzooms past it
+TILES_MAX_ZOOM = 10
+
+# ---------------------------------------------------------------------------
+# 1. Download US county boundary GeoJSON (simplified 20m from Census via Plotly)
+#    and ACS 2024 5-Year population data. The two requests are independent and
+#    network-bound, so they run concurrently; responses are cached on disk for
+#    a day so re-runs skip the network.
+# ---------------------------------------------------------------------------
+print("\n[1/5] Downloading US county boundaries and ACS 2024 population data...")
+session = requests_cache.CachedSession(".cache/http", expire_after=86400)
+with ThreadPoolExecutor(max_workers=2) as executor:
+    counties_future = executor.submit(session.get, COUNTIES_URL, timeout=60)
+    census_future = executor.submit(session.get, CENSUS_URL, timeout=60)
+    counties_resp = counties_future.result()
+    census_resp = census_future.result()
+
+counties_resp.raise_for_status()
+counties_geojson = orjson.loads(counties_resp.content)
+print(f"       Loaded {len(counties_geojson['features']):,} county polygons")
+
+# ---------------------------------------------------------------------------
+# 2. Parse ACS 2024 5-Year population data from the Census Bureau API
+#    Table B01003_001E = Total Population
+# ---------------------------------------------------------------------------
+print("[2/5] Parsing ACS 2024 population data...")
+census_resp.raise_for_status()
+census_raw = orjson.loads(census_resp.content)
 
 # Parse: first row is header, rest is data
 header = census_raw[0]
@@ -51,8 +69,10 @@ df = pd.DataFrame(rows, columns=header)
 df["FIPS"] = df["state"] + df["county"]
 
 # Convert population to numeric (Census returns strings; -666666666 = missing)
-df["population"] = pd.to_numeric(df["B01003_001E"], errors="coerce")
-df = df[df["population"] > 0].copy()
+# Filter on a standalone Series and downcast (uint32 fits every county) in one assign
+population = pd.to_numeric(df["B01003_001E"], errors="coerce")
+valid = population > 0
+df = df.loc[valid].assign(population=pd.to_numeric(population[valid], downcast="unsigned"))
 
 print(f"       Loaded {len(df):,} counties with valid population data")
 print(f"       Range: {df['population'].min():,.0f} - {df['population'].max():,.0f}")
@@ -63,11 +83,13 @@ print(f"       Median: {df['population'].median():,.0f}")
 # ---------------------------------------------------------------------------
 print("[3/5] Computing derived fields...")
 
-# log10(population + 1) for extrusion — compresses huge range
-df["log_pop"] = df["population"].apply(lambda x: math.log10(x + 1))
+pop = df["population"].to_numpy()
+
+# log10(population + 1) for extrusion — compresses huge range (float32 is plenty)
+df["log_pop"] = np.log10(pop + 1).round(4).astype(np.float32)
 
 # Formatted population for tooltips
-df["population_formatted"] = df["population"].apply(lambda x: f"{int(x):,}")
+df["population_formatted"] = [f"{v:,}" for v in pop.tolist()]
 
 # ---------------------------------------------------------------------------
 # 4. Compute quantile-based color ramp
@@ -75,59 +97,66 @@ df["population_formatted"] = df["population"].apply(lambda x: f"{int(x):,}")
 # ---------------------------------------------------------------------------
 print("[4/5] Computing quantile-based colors...")
 
-# Assign quantile rank (0.0 to 1.0) so rural counties get visual spread
-df["quantile"] = df["population"].rank(pct=True)
+# Assign quantile rank (0.0 to 1.0) so rural counties get visual spread.
+# Tied populations share their average rank, as with Series.rank(pct=True).
+sorted_pop = np.sort(pop)
+first = np.searchsorted(sorted_pop, pop, side="left")
+last = np.searchsorted(sorted_pop, pop, side="right")
+df["quantile"] = (first + last + 1) / 2 / len(pop)
 
 
-def population_color(t):
-    """Map quantile [0, 1] to a blue->cyan->green->yellow->red color ramp."""
-    if t < 0.25:
-        s = t / 0.25
-        r, g, b = int(30), int(60 + 140 * s), int(150 + 105 * s)
-    elif t < 0.5:
-        s = (t - 0.25) / 0.25
-        r, g, b = int(30 + 100 * s), int(200 + 55 * s), int(255 - 100 * s)
-    elif t < 0.75:
-        s = (t - 0.5) / 0.25
-        r, g, b = int(130 + 125 * s), int(255 - 55 * s), int(155 - 105 * s)
-    else:
-        s = (t - 0.75) / 0.25
-        r, g, b = int(255), int(200 - 130 * s), int(50 - 50 * s)
-    return [r, g, b, 200]
+# Piecewise-linear ramp: one (start, end) RGB pair per quarter of the quantile range
+RAMP_BREAKS = np.array([0.25, 0.5, 0.75])
+RAMP_START = np.array([[30, 60, 150], [30, 200, 255], [130, 255, 155], [255, 200, 50]])
+RAMP_END = np.array([[30, 200, 255], [130, 255, 155], [255, 200, 50], [255, 70, 0]])
 
 
-df["fill_color"] = df["quantile"].apply(population_color)
+def population_colors(t):
+    """Map an array of quantiles [0, 1] to blue->cyan->green->yellow->red RGB rows."""
+    seg = np.searchsorted(RAMP_BREAKS, t, side="right")
+    s = (t - seg * 0.25) / 0.25
+    start, end = RAMP_START[seg], RAMP_END[seg]
+    rgb = start + (end - start) * s[:, None]
+    # One clip + typed cast for the whole array (no per-value int())
+    return np.clip(rgb, 0, 255).astype(np.uint8)
+
+
+# Pack each color into one 0xRRGGBB integer; alpha is applied in the app's accessor
+rgb = population_colors(df["quantile"].to_numpy()).astype(np.uint32)
+df["fill_color"] = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
 
 # ---------------------------------------------------------------------------
 # 5. Merge into GeoJSON and save
 # ---------------------------------------------------------------------------
 print("[5/5] Merging data into GeoJSON and saving...")
 
-# Build lookup dict
-value_lookup = {}
-for _, row in df.iterrows():
-    value_lookup[row["FIPS"]] = {
-        "population": int(row["population"]),
-        "population_formatted": row["population_formatted"],
-        "log_pop": round(row["log_pop"], 4),
-        "quantile": round(row["quantile"], 4),
-        "fill_color": row["fill_color"],
-        "county_name": row["NAME"],
+# Build per-county feature properties from whole columns (no per-row Series).
+# Only the fields the map reads go into the GeoJSON; the full table is the CSV.
+value_lookup = {
+    fips: {
+        "log_pop": log_pop,
+        "fill_color": fill_color,
+        "county_name": name,
+        "population_formatted": population_formatted,
+        "fips": fips,
     }
-
-# Inject into GeoJSON properties
+    for fips, population_formatted, log_pop, fill_color, name in zip(
+        df["FIPS"].tolist(),
+        df["population_formatted"].tolist(),
+        df["log_pop"].astype(float).round(4).tolist(),
+        df["fill_color"].tolist(),
+        df["NAME"].tolist(),
+    )
+}
+
+# Replace the upstream properties (GEO_ID, LSAD, CENSUSAREA, ...) with ours
 matched_features = []
 for feature in counties_geojson["features"]:
     fips = feature.get("id") or feature["properties"].get("GEO_ID", "")[-5:]
-    if fips in value_lookup:
-        info = value_lookup[fips]
-        feature["properties"]["population"] = info["population"]
-        feature["properties"]["population_formatted"] = info["population_formatted"]
-        feature["properties"]["log_pop"] = info["log_pop"]
-        feature["properties"]["quantile"] = info["quantile"]
-        feature["properties"]["fill_color"] = info["fill_color"]
-        feature["properties"]["county_name"] = info["county_name"]
-        feature["properties"]["fips"] = fips
+    info = value_lookup.get(fips)
+    if info is not None:
+        feature["id"] = fips
+        feature["properties"] = info
         matched_features.append(feature)
 
 counties_geojson["features"] = matched_features
@@ -136,18 +165,68 @@ print(f"       Matched {len(matched_features):,} counties")
 # Save files
 os.makedirs("data", exist_ok=True)
 
+# Simplify the counties as one polygon coverage (GEOS) so shared borders stay
+# identical and every polygon stays valid. Prequantizing or rounding below the
+# source's 6 decimals makes neighbouring arcs cross, so neither is done.
+topology = topojson.Topology(
+    counties_geojson, prequantize=False, presimplify=0.005, simplify_with="geos"
+)
+counties_geojson = orjson.loads(topology.to_geojson(decimals=6))
+invalid = [f["id"] for f in counties_geojson["features"] if not shape(f["geometry"]).is_valid]
+if invalid:
+    raise ValueError(f"Simplification produced invalid geometries: {', '.join(invalid)}")
+print("       Simplified boundaries (tolerance 0.005°, all geometries valid)")
+
 geojson_path = "data/us_counties_population.geojson"
-with open(geojson_path, "w") as f:
-    json.dump(counties_geojson, f)
+geojson_bytes = orjson.dumps(counties_geojson)
+with open(geojson_path, "wb") as f:
+    f.write(geojson_bytes)
 geojson_size = os.path.getsize(geojson_path) / (1024 * 1024)
 print(f"       Saved {geojson_path} ({geojson_size:.1f} MB)")
 
+# Gzipped copy for the app — GeoJSON text compresses several-fold
+geojson_gz_path = geojson_path + ".gz"
+with gzip.open(geojson_gz_path, "wb", compresslevel=6) as f:
+    f.write(geojson_bytes)
+geojson_gz_size = os.path.getsize(geojson_gz_path) / (1024 * 1024)
+print(f"       Saved {geojson_gz_path} ({geojson_gz_size:.1f} MB)")
+
+table_columns = ["FIPS", "NAME", "population", "population_formatted", "log_pop", "quantile"]
+
+# Parquet is the canonical table (typed columns, zstd); the CSV is a readable copy
+parquet_path = "data/us_counties_population.parquet"
+df[table_columns].to_parquet(parquet_path, compression="zstd", index=False)
+parquet_size = os.path.getsize(parquet_path) / 1024
+print(f"       Saved {parquet_path} ({parquet_size:.0f} KB)")
+
 csv_path = "data/us_counties_population.csv"
-df_out = df[["FIPS", "NAME", "population", "population_formatted", "log_pop", "quantile"]].copy()
-df_out.to_csv(csv_path, index=False)
+df.to_csv(csv_path, index=False, columns=table_columns, float_format="%.4f")
 csv_size = os.path.getsize(csv_path) / 1024
 print(f"       Saved {csv_path} ({csv_size:.0f} KB)")
 
+# Optional vector tileset so the app can stream only the tiles in view.
+# No feature/size limits, since dropping polygons would leave holes in the map.
+tiles_dir = "data/tiles"
+if shutil.which("tippecanoe"):
+    subprocess.run(
+        [
+            "tippecanoe",
+            "--output-to-directory", tiles_dir,
+            "--force",
+            f"--maximum-zoom={TILES_MAX_ZOOM}",
+            "--no-feature-limit",
+            "--no-tile-size-limit",
+            "--detect-shared-borders",
+            "--no-tile-compression",
+            "--layer=counties",
+            geojson_path,
+        ],
+        check=True,
+    )
+    print(f"       Saved {tiles_dir}/{{z}}/{{x}}/{{y}}.pbf")
+else:
+    print("       Skipped vector tiles (tippecanoe not installed)")
+
 print(f"\n{'=' * 70}")
 print("SUCCESS: Data preparation complete")
 print(f"{'=' * 70}")